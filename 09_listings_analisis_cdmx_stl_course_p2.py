@@ -10,9 +10,14 @@
 #from os import ST_WRITE
 from calendar import c
 from utils import *
+from geodatos import *
+from almacen import *
+from ocupacion import leer_ocupacion, rutas_ocupacion
+from cubo import *
 from pydeck.types import String
 # Biblioteca local
 import geopandas as gpd
+import os
 
 header("9 casos de negocio con Streamlit")
 st.subheader("9. Análisis de alojamientos temporales en la CDMX. Parte 2.")
@@ -71,24 +76,38 @@ st.markdown("""
     Contiene las diversos tipos de alojamientos temporales con varias _features_ acerca de ellos.
 
     ##### Carga de los datos a la app
+    Los _datasets_ conformados se guardan en un almacén compartido (ver más abajo). Antes de leer 
+    los archivos revisamos si el almacén ya tiene esta versión de los datos; si es así, basta con 
+    leer unos cuantos renglones para mostrar las tablas de ejemplo.
+"""
+with st.echo(code_location='above'):
+    url = "http://data.insideairbnb.com/mexico/df/mexico-city/2021-12-25/visualisations/listings.csv"
+
+    # Incrementar al cambiar las columnas de map_data u hoteles o la validación
+    VERSION_ESQUEMA = 'esquema-4'
+    ALMACENES = ('map_data', 'hoteles', 'validacion')
+    version_datos = version_fuentes(url, 'data/denue_hoteles_cdmx_2020.csv', VERSION_ESQUEMA)
+    almacen_listo = all(os.path.isdir(ruta_almacen(nombre, version_datos))
+                        for nombre in ALMACENES)
+    filas = 5 if almacen_listo else None
+
+"""
     - DENUE
 """
 with st.echo(code_location='above'):
-    pd_hoteles = pd.read_csv('data/denue_hoteles_cdmx_2020.csv', sep='|')
+    pd_hoteles = pd.read_csv('data/denue_hoteles_cdmx_2020.csv', sep='|', nrows=filas)
 
 """
         - AirBNB
 """
 
 with st.echo(code_location='above'):
-    
-    url = "http://data.insideairbnb.com/mexico/df/mexico-city/2021-12-25/visualisations/listings.csv"
-    
-    st.cache_data()
-    def get_data():
-        return pd.read_csv(url)
+    # Una sola entrada: al pedir los 5 renglones se libera la copia completa
+    @st.cache_data(max_entries=1)
+    def get_data(nrows=None):
+        return pd.read_csv(url, nrows=nrows)
 
-    df_abb = get_data()
+    df_abb = get_data(filas)
 
 """
     ___
@@ -110,7 +129,8 @@ with st.echo(code_location='above'):
 """
     
 with st.echo(code_location='above'):
-    map_data = df_abb[["latitude", "longitude", "nom_estab", "nomgeo"]].dropna(how="any")
+    map_data = df_abb[["id", "latitude", "longitude", "nom_estab", "nomgeo", "room_type", "price"]].dropna(
+        subset=["latitude", "longitude", "nom_estab", "nomgeo"])
     st.write(map_data.head(5))
 
 """
@@ -119,7 +139,8 @@ with st.echo(code_location='above'):
 """
 
 with st.echo(code_location='above'):
-    hoteles = pd_hoteles[['latitud', 'longitud','nom_estab','municipio']]
+    hoteles = pd_hoteles[['latitud', 'longitud','nom_estab','municipio',
+                          'nombre_act', 'per_ocu', 'fecha_alta']]
 
 """
    ... y renombramos la columna municipio a nomgeo.
@@ -154,6 +175,53 @@ shape = gpd.read_file('data/limites_alcaldias_cdmx.geojson')
 with st.expander("Visualizar/Ocultar límites de alcaldías", expanded=False):
     st.write(shape)
 
+"""
+    ___
+    #### Validación de los datos
+
+    Antes de llevar los puntos a los mapas revisamos, una sola vez por versión de los datos:
+    - que las coordenadas caigan dentro de la envolvente de las alcaldías,
+    - que no haya establecimientos duplicados (mismo nombre y coordenadas, o casi las mismas),
+    - que el precio de los _listings_ no sea atípico dentro de su alcaldía, usando el rango 
+    intercuartílico (IQR) como en un diagrama de caja.
+
+    El resultado es un arreglo de banderas por renglón. Los mapas descartan los puntos fuera de 
+    límites y los duplicados exactos; los conteos y agregados (densidad, cubo y API) descartan 
+    además los casi duplicados, y las medidas de precio, los precios atípicos. La validación se hace 
+    antes de escribir el almacén compartido, así que sólo se ejecuta una vez por versión.
+"""
+
+st.image('images/Detection-of-Outlier-BoxPlot-1.png')
+
+"""
+    Los _datasets_ validados se escriben una sola vez en un almacén compartido (archivos `.npy` 
+    para las coordenadas y las banderas, y Arrow IPC para los atributos). Cada proceso de Streamlit 
+    los mapea en memoria en modo de solo lectura, de modo que los puntos no se copian en cada 
+    _worker_ y los archivos originales se leen completos sólo la primera vez.
+"""
+
+with st.echo(code_location='above'):
+    def validar(df, latitud, longitud, precio=None):
+        banderas = banderas_validacion(df, latitud, longitud, tuple(shape.total_bounds), precio=precio)
+        # Los mapas usan sólo los puntos válidos; la columna banderas queda para los agregados
+        valido = (banderas & EXCLUIR_MAPA) == 0
+        return df[valido].assign(banderas=banderas[valido]), resumen_banderas(banderas)
+
+    @st.cache_resource
+    def get_almacen(version):
+        if not all(os.path.isdir(ruta_almacen(nombre, version)) for nombre in ALMACENES):
+            abb, resumen_abb = validar(map_data, 'latitude', 'longitude', precio='price')
+            hot, resumen_hot = validar(hoteles, 'latitud', 'longitud')
+            validacion = pd.DataFrame({'bandera': resumen_abb.index,
+                                       'AirBnB': resumen_abb.to_numpy(),
+                                       'Hoteles': resumen_hot.to_numpy()})
+            for nombre, df in zip(ALMACENES, (abb, hot, validacion)):
+                escribir_almacen(df, nombre, version)
+        return tuple(abrir_almacen(ruta_almacen(nombre, version)) for nombre in ALMACENES)
+
+    map_data, hoteles, validacion = get_almacen(version_datos)
+    st.write(validacion)
+
 """
     Más adelante aprederán la manera de visualizar estos polígonos o fronteras de las alcaldías.
 """
@@ -168,6 +236,21 @@ with st.expander("Visualizar/Ocultar límites de alcaldías", expanded=False):
 
 with st.echo(code_location='above)'):
     st.write(shape[shape['nomgeo'] == 'Coyoacán'].g_pnt_2)
+
+"""
+    El centro viene como texto. Para no convertirlo (ni calcular áreas en una proyección métrica) 
+    cada vez que se necesite, calculamos una sola vez una tabla de atributos por alcaldía: el centro 
+    como números, el área en km² y el rectángulo que la contiene (_bounding box_). Las vistas de los 
+    mapas, las etiquetas y las densidades por km² se leen de esta tabla.
+"""
+
+with st.echo(code_location='above'):
+    @st.cache_data
+    def get_atributos(version):
+        return atributos_alcaldias(shape)
+
+    atributos = get_atributos(version_fuentes('data/limites_alcaldias_cdmx.geojson'))
+    st.write(atributos.loc[['Coyoacán']])
     
 """
     Además podemos crear un par de dataframes adicionales que contengan dos conjuntos de 
@@ -192,6 +275,48 @@ with st.echo(code_location='above)'):
 with st.echo(code_location='above)'):
     st.write(shape_b[['cve_mun','nomgeo']].sort_values('cve_mun'))
 
+##
+# Recorte por alcaldía y presupuesto de render de las capas de puntos
+# Se definen antes de los mapas para que todos, incluido el Mapa 1, envíen al navegador
+# a lo más PRESUPUESTO_CAPA bytes por capa.
+##
+
+# El índice conserva geometrías preparadas, por eso es un recurso y no se copia
+@st.cache_resource
+def get_indice_alcaldias():
+    return indice_alcaldias(shape)
+
+# Cada selección se recorta una sola vez; las más recientes quedan en memoria y se
+# comparten entre sesiones sin copiarse
+@st.cache_resource(max_entries=16)
+def recorte_alcaldias(seleccion, version):
+    indice = get_indice_alcaldias()
+    abb = map_data[mascara_alcaldias(indice, seleccion, map_data['latitude'], map_data['longitude'])]
+    hot = hoteles[mascara_alcaldias(indice, seleccion, hoteles['latitud'], hoteles['longitud'])]
+    return abb, hot
+
+PRESUPUESTO_CAPA = 8_000_000    # bytes de JSON por capa que se envían al navegador
+RADIO_PUNTO = 30                # metros
+
+@st.cache_resource(max_entries=32)
+def puntos_en_presupuesto(capa, seleccion, version, presupuesto=PRESUPUESTO_CAPA):
+    abb, hot = recorte_alcaldias(seleccion, version) if seleccion else (map_data, hoteles)
+    # Sólo se envían las columnas que usan la capa y el tooltip
+    if capa == 'Hoteles':
+        df, latitud, longitud = hot[['latitud', 'longitud', 'nom_estab', 'nomgeo']], 'latitud', 'longitud'
+    elif capa == 'AirBnB':
+        df, latitud, longitud = abb[['latitude', 'longitude', 'nom_estab', 'nomgeo']], 'latitude', 'longitude'
+    else:
+        # Los hexágonos sólo usan las coordenadas y no se muestrean: las celdas agregadas
+        # llevan su número de puntos como peso para que los conteos no cambien
+        df, latitud, longitud = abb[['latitude', 'longitude', 'nomgeo']], 'latitude', 'longitude'
+    df_render, modo = ajustar_a_presupuesto(df, latitud, longitud, presupuesto,
+                                            permitir_muestra=(capa != 'AirBnB Hexágonos'))
+    if modo == 'agregado':
+        # El área del círculo es proporcional al número de puntos de la celda
+        df_render = df_render.assign(radio=RADIO_PUNTO * np.sqrt(df_render['puntos']))
+    return df_render, modo, len(df)
+
 ###
 ## ¡Mapas!
 ###
@@ -377,12 +502,13 @@ with st.echo(code_location='above'):
     st.write("""
         ##### Mapa 1: De puntos (_ScatterPlot_) de los _listings_ de AirBnB en la CDMX.
     """)
-    # Capa, nombrara puntos_abb
+    # Capa, nombrara puntos_abb; los puntos pasan por el presupuesto de render
+    puntos_mapa1, modo_mapa1, _ = puntos_en_presupuesto('AirBnB', (), version_datos)
     puntos_abb=pdk.Layer(
         'ScatterplotLayer',
-        data=map_data, 
+        data=puntos_mapa1, 
         get_position='[longitude, latitude]',
-        get_radius=10,          # Radius is given in meters
+        get_radius='radio' if modo_mapa1 == 'agregado' else 10,          # Radius is given in meters
         get_fill_color=[255, 0, 255, 140],
         elevation_scale=0,
         pickable=True
@@ -605,6 +731,38 @@ st.write(shape_a[['nomgeo']].sort_values('nomgeo'))
 
 
 st.error("Revisar el efecto del orden de las capas")
+
+##
+# Selección de alcaldías (drill-down)
+##
+st.sidebar.markdown("""
+## Alcaldías
+#### Seleccione las alcaldías a analizar
+""")
+sel_alcaldias = tuple(sorted(st.sidebar.multiselect(
+    "Alcaldías (vacío = toda la CDMX)", sorted(shape['nomgeo']))))
+
+if sel_alcaldias:
+    shape_sel = shape[shape['nomgeo'].isin(sel_alcaldias)]
+    map_data_sel, hoteles_sel = recorte_alcaldias(sel_alcaldias, version_datos)
+else:
+    shape_sel, map_data_sel, hoteles_sel = shape, map_data, hoteles
+
+# La vista se ajusta al bbox de la selección (o de toda la CDMX)
+vista_sel = viewport_ajustado(limites_seleccion(atributos, sel_alcaldias or atributos.index))
+
+PUNTOS = {capa: puntos_en_presupuesto(capa, sel_alcaldias, version_datos)
+          for capa in ('AirBnB', 'Hoteles', 'AirBnB Hexágonos')}
+
+def radio_capa(capa):
+    return 'radio' if PUNTOS[capa][1] == 'agregado' else RADIO_PUNTO
+
+def pesos_hexagonos(capa):
+    if PUNTOS[capa][1] != 'agregado':
+        return {}
+    return dict(get_elevation_weight='puntos', get_color_weight='puntos',
+                elevation_aggregation=String('SUM'), color_aggregation=String('SUM'))
+
 # Configuración para diseñar el mapa de Mapbox
 ##
 
@@ -612,7 +770,7 @@ st.error("Revisar el efecto del orden de las capas")
 CAPAS = {
     "Fronteras de Alcaldías" : pdk.Layer(
         "GeoJsonLayer",
-        data=shape,
+        data=shape_sel,
         opacity=0.8,
         stroked=False,
         filled=True,
@@ -649,9 +807,9 @@ CAPAS = {
     ),
     "AirBnB" : pdk.Layer(
         'ScatterplotLayer',
-        data=map_data, 
+        data=PUNTOS['AirBnB'][0], 
         get_position='[longitude, latitude]',
-        get_radius=30,          # Radius is given in meters
+        get_radius=radio_capa('AirBnB'),          # Radius is given in meters
         get_fill_color=[230, 126, 34, 90],
         elevation_scale=0,
         #elevation_range=[0, 1000],
@@ -660,9 +818,9 @@ CAPAS = {
 
     "Hoteles" : pdk.Layer(
         'ScatterplotLayer',
-        data=hoteles, 
+        data=PUNTOS['Hoteles'][0], 
         get_position='[longitud, latitud]',
-        get_radius=30,          # Radius is given in meters
+        get_radius=radio_capa('Hoteles'),          # Radius is given in meters
         get_fill_color='[5, 0, 160]',
         elevation_scale=0,
         #elevation_range=[0, 1000],
@@ -671,7 +829,7 @@ CAPAS = {
 
     "AirBnB Hexágonos" : pdk.Layer(
         'HexagonLayer',
-        data=map_data, 
+        data=PUNTOS['AirBnB Hexágonos'][0], 
         get_position='[longitude, latitude]',
         get_radius=30,          # Radius is given in meters
         get_fill_color=[230, 126, 34, 250],
@@ -679,29 +837,27 @@ CAPAS = {
         elevation_scale=2,
         elevation_range=[0, 1000],
         extruded=True,
-        pickable=True
+        pickable=True,
+        **pesos_hexagonos('AirBnB Hexágonos')
     )
 }
-# text = pdk.Layer(
-#     "TextLayer",
-#     data=shape,
-#     pickable=True,
-#     get_position='geometry',
-#     get_text="nomgeo",
-#     get_size=60,
-#     get_color=[160,64,0,20],
-#     get_angle=0,
-#     # Note that string constants in pydeck are explicitly passed as strings
-#     # This distinguishes them from columns in a data set
-#     get_text_anchor=String("middle"),
-#     get_alignment_baseline=String("center"),
-# )
-view_state = pdk.ViewState(
-    latitude=19.3266,
-    longitude=-99.1490,
-    zoom=9.5,
-    pitch=0
+# Etiquetas con los centros precalculados de las alcaldías
+CAPAS["Nombres de Alcaldías"] = pdk.Layer(
+    "TextLayer",
+    data=atributos.loc[list(shape_sel['nomgeo'])].reset_index(),
+    pickable=True,
+    get_position='[centro_lon, centro_lat]',
+    get_text="nomgeo",
+    get_size=16,
+    get_color=[160, 64, 0, 200],
+    get_angle=0,
+    character_set="auto",
+    # Note that string constants in pydeck are explicitly passed as strings
+    # This distinguishes them from columns in a data set
+    get_text_anchor=String("middle"),
+    get_alignment_baseline=String("center"),
 )
+view_state = pdk.ViewState(**vista_sel, pitch=0)
 
 my_tooltip={
     "html": 
@@ -721,9 +877,10 @@ st.sidebar.markdown("""
 ## Capas del Mapa
 #### Seleccione las capas a visualizar
 """)
-selected_layers = [
-    layer for layer_name, layer in CAPAS.items()
+selected_names = [
+    layer_name for layer_name in CAPAS
     if st.sidebar.checkbox(layer_name, True)]
+selected_layers = [CAPAS[layer_name] for layer_name in selected_names]
 if selected_layers:
     st.pydeck_chart(pdk.Deck(
         map_style="mapbox://styles/mapbox/light-v10",
@@ -732,5 +889,92 @@ if selected_layers:
         tooltip=my_tooltip
 
     ))
+    # Aviso cuando una capa de puntos se redujo para no exceder el presupuesto
+    for layer_name in selected_names:
+        if layer_name not in PUNTOS:
+            continue
+        df_render, modo, total = PUNTOS[layer_name]
+        if modo == 'muestra':
+            st.caption(f"{layer_name}: se muestran {len(df_render):,} de {total:,} puntos "
+                       "(muestra estratificada por zona).")
+        elif modo == 'agregado':
+            st.caption(f"{layer_name}: se muestran {len(df_render):,} grupos que representan "
+                       f"los {total:,} puntos.")
 else:
     st.error("Please choose at least one layer above.")
+
+##
+# Densidad por alcaldía
+##
+
+"""
+    ### Alojamientos por km²
+    Con el área precalculada de cada alcaldía obtenemos la densidad de alojamientos.
+"""
+
+@st.cache_data
+def get_densidad(version):
+    return densidad_alcaldias(atributos,
+                              airbnb=conteo_agregados(map_data),
+                              hoteles=conteo_agregados(hoteles))
+
+st.write(get_densidad(version_datos).sort_values('airbnb_km2', ascending=False))
+
+##
+# Gráficas comparativas
+##
+
+"""
+    ### Comparación entre alcaldías
+    Las gráficas no usan los renglones originales: se construye una sola vez un cubo de resumen 
+    (fuente × alcaldía × tipo de alojamiento × personal ocupado × mes de alta) y cada gráfica se 
+    alimenta de una rebanada de él. Las gráficas respetan la selección de alcaldías de la barra lateral.
+"""
+
+@st.cache_data
+def get_cubo(version):
+    return cubo_resumen(map_data, hoteles)
+
+cubo, cajas = get_cubo(version_datos)
+
+dimension = st.radio("Comparar por", ['tipo', 'per_ocu'], horizontal=True,
+                     format_func={'tipo': 'Tipo de alojamiento', 'per_ocu': 'Personal ocupado'}.get)
+fuente = ['DENUE'] if dimension == 'per_ocu' else None
+st.plotly_chart(grafica_barras(cubo, dimension, nomgeo=sel_alcaldias, fuente=fuente),
+                use_container_width=True)
+st.plotly_chart(grafica_altas(cubo, nomgeo=sel_alcaldias), use_container_width=True)
+st.plotly_chart(grafica_cajas(cajas, sel_alcaldias), use_container_width=True)
+
+##
+# Ocupación estimada
+##
+
+"""
+    ___
+    ### Ocupación e ingreso estimado
+
+    Los archivos completos de insideairbnb (`calendar.csv.gz` con 365 renglones por _listing_ y 
+    `reviews.csv.gz`) son demasiado grandes para leerlos en cada ejecución de la app. Se procesan 
+    por bloques, una sola vez, con:
+
+        python ocupacion.py calendar.csv.gz reviews.csv.gz --listings <url de listings.csv>
+
+    y la página sólo lee los agregados resultantes. Una noche se cuenta como ocupada si no está 
+    disponible en el calendario, por lo que la ocupación y el ingreso son cotas superiores.
+"""
+
+@st.cache_data
+def get_ocupacion(version):
+    return leer_ocupacion()
+
+# La llave es la versión de los archivos agregados, no la de los datos de la página
+ocupacion = get_ocupacion(version_fuentes(*rutas_ocupacion()))
+if ocupacion is None:
+    st.warning("Aún no se han calculado los agregados de ocupación (ver ocupacion.py).")
+else:
+    ocupacion_listing, ocupacion_alcaldia = ocupacion
+    st.write(ocupacion_alcaldia.sort_values('ingreso_estimado', ascending=False))
+
+    map_data_ocupacion = map_data_sel.merge(ocupacion_listing, on='id', how='left')
+    st.write(map_data_ocupacion.nlargest(10, 'ingreso_estimado')[
+        ['nom_estab', 'nomgeo', 'tasa_ocupacion', 'ingreso_estimado', 'resenas_12m']])
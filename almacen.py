@@ -0,0 +1,86 @@
+##
+# Almacén compartido de columnas conformadas
+# Las columnas numéricas se guardan como .npy y los atributos de texto como Arrow IPC.
+# Cada proceso (worker de Streamlit, API, etc.) los mapea en memoria en modo de solo
+# lectura, así que los arreglos grandes se comparten por medio del caché de páginas
+# del sistema operativo en lugar de copiarse en cada proceso.
+##
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+DIR_ALMACEN = 'data/almacen'
+
+
+def version_fuentes(*fuentes):
+    """Identificador corto de la versión de los datos a partir de sus fuentes."""
+    h = hashlib.sha1()
+    for fuente in fuentes:
+        h.update(str(fuente).encode())
+        # Para archivos locales la versión cambia si cambia el tamaño o la fecha
+        if os.path.isfile(fuente):
+            st_fuente = os.stat(fuente)
+            h.update(f'{st_fuente.st_size}:{st_fuente.st_mtime_ns}'.encode())
+    return h.hexdigest()[:12]
+
+
+def ruta_almacen(nombre, version, directorio=DIR_ALMACEN):
+    return os.path.join(directorio, version, nombre)
+
+
+def escribir_almacen(df, nombre, version, directorio=DIR_ALMACEN):
+    """
+    Escribe df en el almacén si esa versión no existe todavía y regresa su ruta.
+    La escritura se hace en un directorio temporal que se renombra al final; si otro
+    proceso terminó primero, se descarta la copia propia.
+    """
+    destino = ruta_almacen(nombre, version, directorio)
+    if os.path.isdir(destino):
+        return destino
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f'.{nombre}-', dir=os.path.dirname(destino))
+    df = df.reset_index(drop=True)
+    numericas = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    try:
+        for i, columna in enumerate(numericas):
+            np.save(os.path.join(tmp, f'{i}.npy'), df[columna].to_numpy())
+
+        tabla = pa.Table.from_pandas(df.drop(columns=numericas), preserve_index=False)
+        with pa.OSFile(os.path.join(tmp, 'atributos.arrow'), 'wb') as archivo:
+            with pa.ipc.new_file(archivo, tabla.schema) as escritor:
+                escritor.write_table(tabla)
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as archivo:
+            json.dump({'columnas': list(df.columns), 'numericas': numericas,
+                       'filas': len(df)}, archivo)
+
+        os.rename(tmp, destino)
+    except OSError:
+        if not os.path.isdir(destino):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return destino
+
+
+def abrir_almacen(ruta):
+    """DataFrame respaldado por los archivos mapeados en memoria (sin copias)."""
+    with open(os.path.join(ruta, 'meta.json')) as archivo:
+        meta = json.load(archivo)
+
+    columnas = {}
+    for i, columna in enumerate(meta['numericas']):
+        columnas[columna] = np.load(os.path.join(ruta, f'{i}.npy'), mmap_mode='r')
+
+    tabla = pa.ipc.open_file(pa.memory_map(os.path.join(ruta, 'atributos.arrow'), 'r')).read_all()
+    for columna in tabla.column_names:
+        columnas[columna] = pd.arrays.ArrowExtensionArray(tabla[columna])
+
+    return pd.DataFrame({c: columnas[c] for c in meta['columnas']}, copy=False)
@@ -0,0 +1,238 @@
+##
+# API local de datos agregados
+# Sirve los puntos conformados (map_data y hoteles) y los agregados por alcaldía en JSON
+# o Arrow IPC, sin ejecutar la página de Streamlit. Los puntos se leen del almacén
+# compartido que escribe la app (almacen.py), así que la API no vuelve a leer los CSV.
+#
+# Uso:
+#   python api.py --puerto 8502
+#
+#   GET /version
+#   GET /puntos/airbnb?bbox=-99.2,19.3,-99.1,19.45&formato=arrow
+#   GET /puntos/hoteles?alcaldia=Coyoacán&alcaldia=Tlalpan
+#   GET /alcaldias?formato=json
+#   GET /alcaldias?alcaldia=Coyoacán&formato=arrow
+#
+# Por versión de los datos se guardan en caché los agregados por alcaldía y las máscaras
+# de los recortes por alcaldía; el bbox se aplica en cada consulta, así que el caché no
+# crece con las coordenadas pedidas.
+##
+import argparse
+import functools
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+
+from almacen import DIR_ALMACEN, abrir_almacen, ruta_almacen, version_fuentes
+from geodatos import (EXCLUIR_PRECIO, atributos_alcaldias, conteo_agregados,
+                      densidad_alcaldias, indice_alcaldias, mascara_alcaldias)
+from ocupacion import leer_ocupacion, rutas_ocupacion
+
+RUTA_LIMITES = 'data/limites_alcaldias_cdmx.geojson'
+
+# Capa -> (nombre en el almacén, columna de latitud, columna de longitud)
+CAPAS = {
+    'airbnb': ('map_data', 'latitude', 'longitude'),
+    'hoteles': ('hoteles', 'latitud', 'longitud'),
+}
+
+# Parámetros que acepta cada ruta; los demás son un error 400
+PARAMETROS_ALCALDIAS = {'formato', 'alcaldia'}
+PARAMETROS_PUNTOS = {'formato', 'alcaldia', 'bbox'}
+
+
+class ErrorConsulta(Exception):
+    pass
+
+
+class RecursoDesconocido(ErrorConsulta):
+    pass
+
+
+def version_actual(directorio=DIR_ALMACEN):
+    """Versión más reciente del almacén que ya tiene todas las capas, o None."""
+    versiones = []
+    if os.path.isdir(directorio):
+        for entrada in os.scandir(directorio):
+            if entrada.is_dir() and all(os.path.isdir(ruta_almacen(nombre, entrada.name, directorio))
+                                        for nombre, _, _ in CAPAS.values()):
+                versiones.append((entrada.stat().st_mtime, entrada.name))
+    return max(versiones)[1] if versiones else None
+
+
+_candado_carga = threading.Lock()
+
+
+def cargar(version):
+    """Puntos validados, índice y atributos de las alcaldías para una versión de los datos."""
+    # Un solo hilo lee el almacén; los demás esperan y reciben el mismo resultado
+    with _candado_carga:
+        return _cargar(version)
+
+
+@functools.lru_cache(maxsize=2)
+def _cargar(version):
+    # El almacén ya contiene sólo los puntos válidos para mapas, con su columna banderas
+    shape = gpd.read_file(RUTA_LIMITES)
+    puntos = {capa: abrir_almacen(ruta_almacen(nombre, version))
+              for capa, (nombre, _, _) in CAPAS.items()}
+    return puntos, indice_alcaldias(shape), atributos_alcaldias(shape)
+
+
+def _validar_alcaldias(indice, alcaldias):
+    desconocidas = set(alcaldias) - set(indice)
+    if desconocidas:
+        raise ErrorConsulta(f'alcaldía desconocida: {", ".join(sorted(desconocidas))}')
+
+
+@functools.lru_cache(maxsize=4)
+def _agregados(version, version_ocupacion):
+    # version_ocupacion sólo forma parte de la llave: cambia cuando ocupacion.py
+    # reescribe sus agregados
+    puntos, _, atributos = cargar(version)
+    agregados = densidad_alcaldias(atributos,
+                                   airbnb=conteo_agregados(puntos['airbnb']),
+                                   hoteles=conteo_agregados(puntos['hoteles']))
+    abb = puntos['airbnb']
+    precio = abb['price'].where((abb['banderas'] & EXCLUIR_PRECIO) == 0)
+    agregados['precio_mediano'] = precio.groupby(abb['nomgeo'].astype(str)).median()
+
+    ocupacion = leer_ocupacion()
+    if ocupacion is not None:
+        agregados = agregados.join(ocupacion[1].set_index('nomgeo'), rsuffix='_ocupacion')
+    return agregados.reset_index()
+
+
+def agregados_alcaldias(version, version_ocupacion=None, alcaldias=()):
+    """Agregados por alcaldía, sólo de las alcaldías dadas si alcaldias no está vacío."""
+    agregados = _agregados(version, version_ocupacion)
+    if alcaldias:
+        _validar_alcaldias(cargar(version)[1], alcaldias)
+        agregados = agregados[agregados['nomgeo'].isin(alcaldias)]
+    return agregados
+
+
+@functools.lru_cache(maxsize=32)
+def _mascara_recorte(version, capa, alcaldias):
+    # Un byte por punto: el caché queda acotado por el número de puntos de la capa
+    puntos, indice, _ = cargar(version)
+    _, latitud, longitud = CAPAS[capa]
+    df = puntos[capa]
+    return mascara_alcaldias(indice, alcaldias, df[latitud], df[longitud])
+
+
+def filtrar_puntos(version, capa, bbox=None, alcaldias=()):
+    if capa not in CAPAS:
+        raise RecursoDesconocido(f'capa desconocida: {capa}')
+    puntos, indice, _ = cargar(version)
+    _, latitud, longitud = CAPAS[capa]
+    df = puntos[capa]
+    mascara = np.ones(len(df), dtype=bool)
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        x = df[longitud].to_numpy(dtype=float)
+        y = df[latitud].to_numpy(dtype=float)
+        mascara &= (x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy)
+    if alcaldias:
+        _validar_alcaldias(indice, alcaldias)
+        mascara &= _mascara_recorte(version, capa, tuple(sorted(alcaldias)))
+    return df[mascara]
+
+
+def serializar(df, formato):
+    """(contenido, tipo MIME) de df en el formato pedido."""
+    if formato == 'json':
+        return df.to_json(orient='records', force_ascii=False).encode(), 'application/json'
+    if formato == 'arrow':
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        salida = pa.BufferOutputStream()
+        with pa.ipc.new_stream(salida, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+        return salida.getvalue().to_pybytes(), 'application/vnd.apache.arrow.stream'
+    raise ErrorConsulta(f'formato desconocido: {formato}')
+
+
+def respuesta(version, version_ocupacion, ruta, consulta):
+    """
+    (contenido, tipo MIME) de la consulta; consulta es el resultado de parse_qs.
+    version_ocupacion identifica los agregados de ocupacion.py que usa /alcaldias.
+    """
+    if ruta == '/alcaldias':
+        permitidos = PARAMETROS_ALCALDIAS
+    elif ruta.startswith('/puntos/'):
+        permitidos = PARAMETROS_PUNTOS
+    else:
+        raise RecursoDesconocido(f'ruta desconocida: {ruta}')
+    sobrantes = set(consulta) - permitidos
+    if sobrantes:
+        raise ErrorConsulta(f'parámetro no válido en {ruta}: {", ".join(sorted(sobrantes))}')
+
+    formato = consulta.get('formato', ['json'])[0]
+    alcaldias = tuple(sorted(set(consulta.get('alcaldia', ()))))
+    if ruta == '/alcaldias':
+        return serializar(agregados_alcaldias(version, version_ocupacion, alcaldias), formato)
+
+    bbox = None
+    if 'bbox' in consulta:
+        try:
+            bbox = tuple(float(v) for v in consulta['bbox'][0].split(','))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4:
+            raise ErrorConsulta('bbox debe ser minx,miny,maxx,maxy')
+    return serializar(filtrar_puntos(version, ruta[len('/puntos/'):], bbox, alcaldias), formato)
+
+
+class ManejadorAPI(BaseHTTPRequestHandler):
+
+    def _enviar(self, codigo, contenido, tipo):
+        self.send_response(codigo)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def _error(self, codigo, mensaje):
+        self._enviar(codigo, json.dumps({'error': mensaje}).encode(), 'application/json')
+
+    def do_GET(self):
+        partes = urlsplit(self.path)
+        version = version_actual()
+        if version is None:
+            return self._error(503, 'el almacén de datos aún no existe; ejecute la app una vez')
+
+        if partes.path == '/version':
+            return self._enviar(200, json.dumps({'version': version}).encode(), 'application/json')
+
+        consulta = parse_qs(partes.query)
+        version_ocupacion = (version_fuentes(*rutas_ocupacion())
+                             if partes.path == '/alcaldias' else None)
+        try:
+            contenido, tipo = respuesta(version, version_ocupacion, partes.path, consulta)
+        except ErrorConsulta as error:
+            return self._error(404 if isinstance(error, RecursoDesconocido) else 400, str(error))
+        except Exception as error:
+            self.log_error('Error en %s: %r', self.path, error)
+            return self._error(500, f'error interno: {type(error).__name__}')
+        self._enviar(200, contenido, tipo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API local de datos de alojamientos de la CDMX.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8502)
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer((args.host, args.puerto), ManejadorAPI)
+    print(f'API en http://{args.host}:{args.puerto}/')
+    servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+##
+# Prueba y medición de descarga.py sin conexión, contra servidor_local.py
+# 1. Crea un snapshot sintético con las mismas rutas que ARCHIVOS_SNAPSHOT.
+# 2. Lo descarga a través de un servidor que corta cada respuesta después de --corte
+#    bytes, repitiendo hasta terminar; así se ejercita la reanudación con Range.
+# 3. Verifica que los bytes descargados sean idénticos (sha256) a los originales.
+# 4. Comprueba que un .part no se reanude si el archivo remoto cambió (If-Range) ni
+#    si es más grande que el archivo remoto.
+# 5. Mide una descarga completa sin cortes.
+#
+# Uso:
+#   python banco_descarga.py --mb 8 --corte 1000000
+##
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from descarga import ARCHIVOS_SNAPSHOT, descargar_snapshot, fallas
+from servidor_local import ServidorLocal
+
+
+def snapshot_sintetico(directorio, tam):
+    """Escribe archivos aleatorios de tam bytes y regresa {archivo: sha256}."""
+    sumas = {}
+    for archivo in ARCHIVOS_SNAPSHOT:
+        ruta = os.path.join(directorio, archivo)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        datos = os.urandom(tam)
+        with open(ruta, 'wb') as f:
+            f.write(datos)
+        sumas[archivo] = hashlib.sha256(datos).hexdigest()
+    return sumas
+
+
+def reescribir(directorio, archivo, tam):
+    """Cambia el contenido de un archivo del snapshot y regresa su nuevo sha256."""
+    ruta = os.path.join(directorio, archivo)
+    anterior = os.stat(ruta)
+    datos = os.urandom(tam)
+    with open(ruta, 'wb') as f:
+        f.write(datos)
+    # Garantiza un validador distinto aunque el reloj del sistema de archivos sea grueso
+    os.utime(ruta, ns=(anterior.st_atime_ns, anterior.st_mtime_ns + 1_000_000_000))
+    return hashlib.sha256(datos).hexdigest()
+
+
+def verificar(destino, sumas):
+    for archivo, suma in sumas.items():
+        with open(os.path.join(destino, archivo), 'rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() != suma:
+                raise SystemExit(f'{archivo}: el contenido no coincide')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba y medición de descarga.py sin conexión.')
+    parser.add_argument('--mb', type=float, default=8, help='tamaño de cada archivo en MB')
+    parser.add_argument('--corte', type=int, default=1_000_000,
+                        help='bytes por respuesta antes de cortar la conexión')
+    parser.add_argument('--conexiones', type=int, default=4)
+    args = parser.parse_args()
+    tam = int(args.mb * 1e6)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        origen = os.path.join(tmp, 'origen')
+        sumas = snapshot_sintetico(origen, tam)
+
+        # Reanudación: cada intento avanza a lo más «corte» bytes por archivo
+        destino = os.path.join(tmp, 'reanudado')
+        intentos = 0
+        with ServidorLocal(origen, corte=args.corte) as servidor:
+            pendientes = True
+            while pendientes:
+                intentos += 1
+                if intentos > tam // args.corte + 2:
+                    raise SystemExit(f'no terminó en {intentos - 1} intentos: {pendientes}')
+                pendientes = fallas(descargar_snapshot(servidor.url, ARCHIVOS_SNAPSHOT, destino,
+                                                       args.conexiones, sha256=sumas, progreso=None))
+        verificar(destino, sumas)
+        print(f'Reanudación correcta: {intentos} intentos con cortes de {args.corte:,} bytes')
+
+        # Archivo remoto cambiado: el .part del contenido anterior no se reanuda
+        destino = os.path.join(tmp, 'cambiado')
+        archivo = ARCHIVOS_SNAPSHOT[0]
+        with ServidorLocal(origen, corte=args.corte) as servidor:
+            descargar_snapshot(servidor.url, [archivo], destino, sha256=sumas, progreso=None)
+        if not os.path.exists(os.path.join(destino, archivo + '.part')):
+            raise SystemExit(f'{archivo}: no quedó un .part que reanudar')
+        sumas[archivo] = reescribir(origen, archivo, tam)
+        with ServidorLocal(origen) as servidor:
+            resultados = descargar_snapshot(servidor.url, [archivo], destino, sha256=sumas,
+                                            progreso=None)
+        if fallas(resultados):
+            raise SystemExit(f'archivo cambiado: {fallas(resultados)}')
+        verificar(destino, {archivo: sumas[archivo]})
+
+        # .part más grande que el archivo remoto (con validador vigente): se descarta
+        parcial = os.path.join(destino, archivo + '.part')
+        with ServidorLocal(origen, corte=args.corte) as servidor:
+            descargar_snapshot(servidor.url, [archivo], destino, sha256=sumas, progreso=None,
+                               reemplazar=True)
+            with open(parcial, 'ab') as f:
+                f.write(os.urandom(tam))
+        with ServidorLocal(origen) as servidor:
+            resultados = descargar_snapshot(servidor.url, [archivo], destino, sha256=sumas,
+                                            progreso=None, reemplazar=True)
+        if fallas(resultados):
+            raise SystemExit(f'.part sobrado: {fallas(resultados)}')
+        verificar(destino, {archivo: sumas[archivo]})
+        print('Archivo remoto cambiado y .part sobrado: se descargaron de nuevo')
+
+        # Medición sin cortes
+        destino = os.path.join(tmp, 'completo')
+        with ServidorLocal(origen) as servidor:
+            inicio = time.perf_counter()
+            resultados = descargar_snapshot(servidor.url, ARCHIVOS_SNAPSHOT, destino,
+                                            args.conexiones, sha256=sumas, progreso=None)
+            segundos = time.perf_counter() - inicio
+        if fallas(resultados):
+            raise SystemExit(f'fallas: {fallas(resultados)}')
+        verificar(destino, sumas)
+        total = tam * len(ARCHIVOS_SNAPSHOT) / 1e6
+        print(f'{total:,.1f} MB en {segundos:,.2f} s ({total / segundos:,.1f} MB/s, '
+              f'{args.conexiones} conexiones)')
+
+
+if __name__ == '__main__':
+    main()
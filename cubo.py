@@ -0,0 +1,116 @@
+##
+# Cubo de resumen para las gráficas de Plotly
+# Se construye una sola vez a partir de los datasets conformados (map_data y hoteles)
+# con las dimensiones fuente × alcaldía × tipo de alojamiento × personal ocupado ×
+# mes de alta. Las gráficas se alimentan de rebanadas del cubo, que tiene unos cuantos
+# miles de renglones, y no de los renglones originales.
+##
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from geodatos import EXCLUIR_AGREGADOS, PRECIO_ATIPICO
+
+DIMENSIONES = ['fuente', 'nomgeo', 'tipo', 'per_ocu', 'mes']
+SIN_DATO = 'N/D'
+
+
+def _datos_cubo(map_data, hoteles):
+    # Los casi duplicados no cuentan; los precios atípicos cuentan, pero se excluyen de
+    # las medidas de precio
+    map_data = map_data[(map_data['banderas'] & EXCLUIR_AGREGADOS) == 0]
+    hoteles = hoteles[(hoteles['banderas'] & EXCLUIR_AGREGADOS) == 0]
+    precio = pd.to_numeric(map_data['price'], errors='coerce').astype(float)
+    precio = precio.where((map_data['banderas'] & PRECIO_ATIPICO) == 0)
+    abb = pd.DataFrame({
+        'fuente': 'AirBnB',
+        'nomgeo': map_data['nomgeo'].astype(str).to_numpy(),
+        'tipo': map_data['room_type'].astype(str).to_numpy(),
+        'per_ocu': SIN_DATO,
+        'mes': SIN_DATO,
+        'precio': precio.to_numpy(),
+    })
+    hot = pd.DataFrame({
+        'fuente': 'DENUE',
+        'nomgeo': hoteles['nomgeo'].astype(str).to_numpy(),
+        'tipo': hoteles['nombre_act'].astype(str).to_numpy(),
+        'per_ocu': hoteles['per_ocu'].astype(str).to_numpy(),
+        'mes': hoteles['fecha_alta'].astype(str).str[:7].to_numpy(),
+        'precio': float('nan'),
+    })
+    return pd.concat([abb, hot], ignore_index=True)
+
+
+def cubo_resumen(map_data, hoteles):
+    """
+    Regresa (cubo, cajas). cubo está indexado por DIMENSIONES con medidas aditivas
+    (establecimientos, con_precio, suma_precio). Los cuartiles no se pueden sumar entre
+    celdas, así que cajas guarda las estadísticas de diagrama de caja del precio por
+    alcaldía y tipo de alojamiento.
+    """
+    datos = _datos_cubo(map_data, hoteles)
+    cubo = datos.groupby(DIMENSIONES).agg(
+        establecimientos=('precio', 'size'),
+        con_precio=('precio', 'count'),
+        suma_precio=('precio', 'sum'),
+    )
+
+    precios = datos.dropna(subset=['precio'])
+    cuartiles = precios.groupby(['nomgeo', 'tipo'])['precio'].quantile([0, 0.25, 0.5, 0.75, 1])
+    cajas = cuartiles.unstack().set_axis(['minimo', 'q1', 'mediana', 'q3', 'maximo'], axis=1)
+    iqr = cajas['q3'] - cajas['q1']
+    cajas['limite_inferior'] = (cajas['q1'] - 1.5 * iqr).clip(lower=cajas['minimo'])
+    cajas['limite_superior'] = (cajas['q3'] + 1.5 * iqr).clip(upper=cajas['maximo'])
+    cajas['n'] = precios.groupby(['nomgeo', 'tipo']).size()
+    return cubo, cajas
+
+
+def rebanada(cubo, por, **filtros):
+    """
+    Suma el cubo sobre las dimensiones que no están en por, después de filtrar cada
+    dimensión de filtros a los valores dados (una lista vacía o None no filtra).
+    """
+    datos = cubo
+    for dimension, valores in filtros.items():
+        if valores:
+            datos = datos[datos.index.get_level_values(dimension).isin(list(valores))]
+    resultado = datos.groupby(level=por).sum()
+    resultado['precio_promedio'] = resultado['suma_precio'] / resultado['con_precio']
+    return resultado.reset_index()
+
+
+##
+# Gráficas
+##
+
+def grafica_barras(cubo, dimension='tipo', **filtros):
+    datos = rebanada(cubo, ['nomgeo', dimension], **filtros)
+    return px.bar(datos, x='nomgeo', y='establecimientos', color=dimension,
+                  labels={'nomgeo': 'Alcaldía', 'establecimientos': 'Establecimientos'})
+
+
+def grafica_altas(cubo, **filtros):
+    """Altas mensuales acumuladas de establecimientos del DENUE por alcaldía."""
+    datos = rebanada(cubo, ['nomgeo', 'mes'], fuente=['DENUE'], **filtros)
+    datos = datos[datos['mes'] != SIN_DATO].sort_values('mes')
+    datos['acumulado'] = datos.groupby('nomgeo')['establecimientos'].cumsum()
+    return px.line(datos, x='mes', y='acumulado', color='nomgeo',
+                   labels={'mes': 'Mes de alta', 'acumulado': 'Establecimientos', 'nomgeo': 'Alcaldía'})
+
+
+def grafica_cajas(cajas, alcaldias=None, tipo=None):
+    """Diagrama de caja del precio a partir de las estadísticas precalculadas."""
+    datos = cajas.reset_index()
+    if alcaldias:
+        datos = datos[datos['nomgeo'].isin(list(alcaldias))]
+    if tipo:
+        datos = datos[datos['tipo'] == tipo]
+    figura = go.Figure()
+    for tipo_alojamiento, grupo in datos.groupby('tipo'):
+        figura.add_trace(go.Box(
+            name=tipo_alojamiento, x=grupo['nomgeo'],
+            q1=grupo['q1'], median=grupo['mediana'], q3=grupo['q3'],
+            lowerfence=grupo['limite_inferior'], upperfence=grupo['limite_superior'],
+        ))
+    figura.update_layout(boxmode='group', yaxis_title='Precio por noche', xaxis_title='Alcaldía')
+    return figura
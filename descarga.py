@@ -0,0 +1,200 @@
+##
+# Descarga concurrente de un snapshot completo de insideairbnb al espejo local
+# Todos los archivos se bajan al mismo tiempo con un número acotado de conexiones.
+# Cada archivo se escribe primero en <archivo>.part; si la descarga se interrumpe, la
+# siguiente ejecución la reanuda con una petición Range condicionada (If-Range) al
+# validador guardado en <archivo>.part.validador. Al terminar se verifica el tamaño
+# (y el sha256 si se conoce) antes de renombrar al nombre final.
+#
+# Uso:
+#   python descarga.py
+#   python descarga.py --base http://127.0.0.1:8000/ --destino /tmp/espejo   (servidor_local.py)
+##
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import time
+
+import aiohttp
+
+BASE_SNAPSHOT = 'http://data.insideairbnb.com/mexico/df/mexico-city/2021-12-25/'
+ARCHIVOS_SNAPSHOT = (
+    'data/listings.csv.gz',
+    'data/calendar.csv.gz',
+    'data/reviews.csv.gz',
+    'visualisations/listings.csv',
+    'visualisations/neighbourhoods.geojson',
+)
+DIR_ESPEJO = 'data/insideairbnb'
+TAM_TROZO = 1 << 16
+
+
+class ErrorDescarga(Exception):
+    pass
+
+
+def _sha256(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for trozo in iter(lambda: archivo.read(1 << 20), b''):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def progreso_consola(nombre, anterior, descargados, total):
+    """
+    Una línea por archivo cada 10 % (o cada 10 MB si no se conoce el tamaño); las
+    líneas de descargas concurrentes se intercalan, pero cada una se lee completa.
+    """
+    paso = total / 10 if total else 10e6
+    if descargados // paso == anterior // paso:
+        return
+    if total:
+        print(f'{nombre}: {descargados / total:.0%} de {total / 1e6:,.1f} MB', flush=True)
+    else:
+        print(f'{nombre}: {descargados / 1e6:,.1f} MB', flush=True)
+
+
+def _validador(respuesta):
+    # If-Range sólo admite ETag fuertes; si no hay uno se usa Last-Modified
+    etag = respuesta.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return respuesta.headers.get('Last-Modified')
+
+
+def _estado_parcial(parcial, ruta_validador):
+    """(bytes ya descargados, validador) del .part; sin validador no se puede reanudar."""
+    if not (os.path.exists(parcial) and os.path.exists(ruta_validador)):
+        return 0, None
+    with open(ruta_validador) as archivo:
+        return os.path.getsize(parcial), archivo.read()
+
+
+def _descartar(*rutas):
+    for ruta in rutas:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+async def descargar_archivo(sesion, url, destino, sha256=None, progreso=None):
+    """
+    Descarga url en destino reanudando desde destino.part si existe. Junto al .part se
+    guarda el validador de la respuesta (ETag o Last-Modified) y la reanudación lo envía
+    en If-Range: si el archivo remoto cambió, el servidor responde completo y se empieza
+    de cero. Un .part que no corresponde al archivo remoto también se descarta.
+    """
+    nombre = os.path.basename(destino)
+    parcial = destino + '.part'
+    ruta_validador = parcial + '.validador'
+
+    for _ in range(2):
+        inicio, validador = _estado_parcial(parcial, ruta_validador)
+        cabeceras = {'Range': f'bytes={inicio}-', 'If-Range': validador} if inicio else {}
+        async with sesion.get(url, headers=cabeceras) as respuesta:
+            if respuesta.status == 416:
+                rango = re.search(r'/(\d+)$', respuesta.headers.get('Content-Range', ''))
+                total = int(rango.group(1)) if rango else None
+                if total == inicio:
+                    break       # El .part ya está completo
+                # El .part es más grande que el archivo remoto: se empieza de nuevo
+                _descartar(parcial, ruta_validador)
+                continue
+            respuesta.raise_for_status()
+            if respuesta.status == 206 and _validador(respuesta) != validador:
+                # El servidor ignoró If-Range y el archivo remoto ya no es el mismo
+                _descartar(parcial, ruta_validador)
+                continue
+            if respuesta.status != 206:
+                inicio = 0      # Respuesta completa (sin Range o archivo cambiado): de cero
+
+            total = inicio + respuesta.content_length if respuesta.content_length else None
+            nuevo = _validador(respuesta)
+            if nuevo:
+                with open(ruta_validador, 'w') as archivo:
+                    archivo.write(nuevo)
+            else:
+                _descartar(ruta_validador)
+            descargados = inicio
+            with open(parcial, 'ab' if inicio else 'wb') as archivo:
+                async for trozo in respuesta.content.iter_chunked(TAM_TROZO):
+                    archivo.write(trozo)
+                    descargados += len(trozo)
+                    if progreso:
+                        progreso(nombre, descargados - len(trozo), descargados, total)
+            break
+    else:
+        raise ErrorDescarga(f'{url}: el archivo remoto cambió durante la descarga')
+
+    tam = os.path.getsize(parcial)
+    if total is not None and tam != total:
+        raise ErrorDescarga(f'{url}: se recibieron {tam} de {total} bytes')
+    if sha256 is not None and _sha256(parcial) != sha256:
+        _descartar(parcial, ruta_validador)
+        raise ErrorDescarga(f'{url}: el sha256 no coincide')
+    os.replace(parcial, destino)
+    _descartar(ruta_validador)
+    return destino
+
+
+async def descargar(base=BASE_SNAPSHOT, archivos=ARCHIVOS_SNAPSHOT, destino=DIR_ESPEJO,
+                    conexiones=4, sha256=None, progreso=progreso_consola, reemplazar=False):
+    """
+    Descarga concurrentemente los archivos (rutas relativas a base) en destino.
+    Los archivos que ya existen se omiten salvo con reemplazar=True. Una falla no
+    interrumpe las demás descargas: regresa {archivo: ruta local o excepción} en el
+    mismo orden que archivos; los .part de las fallas quedan para reanudar.
+    """
+    sha256 = sha256 or {}
+    conector = aiohttp.TCPConnector(limit=conexiones)
+    tiempos = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+    async with aiohttp.ClientSession(connector=conector, timeout=tiempos) as sesion:
+        tareas = []
+        for archivo in archivos:
+            local = os.path.join(destino, archivo)
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            if os.path.exists(local) and not reemplazar:
+                tareas.append(asyncio.sleep(0, result=local))
+                continue
+            tareas.append(descargar_archivo(sesion, base + archivo, local,
+                                            sha256.get(archivo), progreso))
+        # Se espera a todas las tareas antes de cerrar la sesión
+        resultados = await asyncio.gather(*tareas, return_exceptions=True)
+    return dict(zip(archivos, resultados))
+
+
+def fallas(resultados):
+    """{archivo: excepción} de las descargas que no terminaron."""
+    return {archivo: r for archivo, r in resultados.items() if isinstance(r, BaseException)}
+
+
+def descargar_snapshot(*args, **kwargs):
+    """Versión síncrona de descargar()."""
+    return asyncio.run(descargar(*args, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Descarga un snapshot de insideairbnb.')
+    parser.add_argument('--base', default=BASE_SNAPSHOT)
+    parser.add_argument('--destino', default=DIR_ESPEJO)
+    parser.add_argument('--conexiones', type=int, default=4)
+    parser.add_argument('--reemplazar', action='store_true')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resultados = descargar_snapshot(args.base, ARCHIVOS_SNAPSHOT, args.destino,
+                                    args.conexiones, reemplazar=args.reemplazar)
+    errores = fallas(resultados)
+    rutas = [r for archivo, r in resultados.items() if archivo not in errores]
+    tam = sum(os.path.getsize(ruta) for ruta in rutas)
+    print(f'{len(rutas)} archivos, {tam / 1e6:,.1f} MB en {time.perf_counter() - inicio:,.1f} s')
+    for archivo, error in errores.items():
+        print(f'FALLÓ {archivo}: {error!r}')
+    if errores:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+##
+# Utilerías de geodatos del proyecto
+# Funciones sin dependencia de streamlit para recortar, ubicar y validar los datasets
+# sobre los polígonos de las alcaldías.
+##
+import math
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+##
+# Recorte por alcaldía
+##
+
+def indice_alcaldias(shape, columna='nomgeo'):
+    """Índice {alcaldía: (geometría preparada, bbox)} para recortar puntos."""
+    indice = {}
+    for nombre, geometria in zip(shape[columna], shape.geometry):
+        # Preparar la geometría acelera las pruebas punto-en-polígono repetidas
+        shapely.prepare(geometria)
+        indice[nombre] = (geometria, geometria.bounds)
+    return indice
+
+
+def mascara_alcaldias(indice, seleccion, latitudes, longitudes):
+    """Máscara booleana de los puntos que caen dentro de las alcaldías seleccionadas."""
+    x = np.asarray(longitudes, dtype=float)
+    y = np.asarray(latitudes, dtype=float)
+    mascara = np.zeros(len(x), dtype=bool)
+    for nombre in seleccion:
+        geometria, (minx, miny, maxx, maxy) = indice[nombre]
+        # Primero se descartan los puntos fuera del bbox, luego se prueba el polígono
+        candidatos = ~mascara & (x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy)
+        if candidatos.any():
+            mascara[candidatos] = shapely.contains_xy(geometria, x[candidatos], y[candidatos])
+    return mascara
+
+
+def limites_seleccion(atributos, seleccion):
+    """Bbox (minx, miny, maxx, maxy) que cubre todas las alcaldías seleccionadas."""
+    limites = atributos.loc[list(seleccion), ['minx', 'miny', 'maxx', 'maxy']]
+    return (limites['minx'].min(), limites['miny'].min(),
+            limites['maxx'].max(), limites['maxy'].max())
+
+
+##
+# Atributos geométricos de las alcaldías
+# Se calculan una sola vez a partir de limites_alcaldias_cdmx.geojson.
+##
+
+# Lambert azimutal equivalente centrada en la CDMX: conserva las áreas
+CRS_AREA = '+proj=laea +lat_0=19.4 +lon_0=-99.15 +datum=WGS84 +units=m +no_defs'
+
+
+def atributos_alcaldias(shape):
+    """
+    DataFrame indexado por nomgeo con cve_mun, el centro geográfico (g_pnt_2) como
+    flotantes, el área en km² y el bbox de cada alcaldía.
+    """
+    centro = shape['g_pnt_2'].str.split(',', expand=True).astype(float)
+    limites = shape.bounds
+    return pd.DataFrame({
+        'nomgeo': shape['nomgeo'].to_numpy(),
+        'cve_mun': shape['cve_mun'].to_numpy(),
+        'centro_lat': centro[0].to_numpy(),
+        'centro_lon': centro[1].to_numpy(),
+        'area_km2': (shape.to_crs(CRS_AREA).area / 1e6).to_numpy(),
+        'minx': limites['minx'].to_numpy(),
+        'miny': limites['miny'].to_numpy(),
+        'maxx': limites['maxx'].to_numpy(),
+        'maxy': limites['maxy'].to_numpy(),
+    }).set_index('nomgeo')
+
+
+def densidad_alcaldias(atributos, **conteos):
+    """Puntos y puntos por km² por alcaldía; cada conteo es una serie indexada por nomgeo."""
+    densidad = atributos[['area_km2']].copy()
+    for nombre, conteo in conteos.items():
+        conteo = conteo.set_axis(conteo.index.astype(str))
+        densidad[nombre] = conteo.reindex(densidad.index, fill_value=0)
+        densidad[f'{nombre}_km2'] = densidad[nombre] / densidad['area_km2']
+    return densidad
+
+
+##
+# Vista ajustada
+##
+
+def _mercator_y(latitud):
+    return math.log(math.tan(math.pi / 4 + math.radians(latitud) / 2))
+
+
+def viewport_ajustado(limites, ancho=700, alto=500, margen=0.1, max_zoom=18):
+    """
+    Centro y zoom de deck.gl (Web Mercator, teselas de 512 px) que encuadran el bbox
+    dentro de un mapa de ancho x alto píxeles. Se regresa un diccionario para
+    pdk.ViewState(**vista).
+    """
+    minx, miny, maxx, maxy = limites
+    y_min, y_max = _mercator_y(miny), _mercator_y(maxy)
+
+    dx = max(maxx - minx, 1e-6) * (1 + margen)
+    dy = max(y_max - y_min, 1e-6) * (1 + margen)
+    zoom_x = math.log2(ancho * 360 / (512 * dx))
+    zoom_y = math.log2(alto * 2 * math.pi / (512 * dy))
+
+    latitud = math.degrees(2 * math.atan(math.exp((y_min + y_max) / 2)) - math.pi / 2)
+    return dict(
+        latitude=latitud,
+        longitude=(minx + maxx) / 2,
+        zoom=max(0, min(zoom_x, zoom_y, max_zoom)),
+    )
+
+
+##
+# Presupuesto de render
+# st.pydeck_chart envía los datos de cada capa como JSON (lista de registros), así que
+# el tamaño del mensaje crece linealmente con el número de puntos.
+##
+
+def estimar_bytes(df, muestra=500, semilla=0):
+    """Tamaño estimado, en bytes, del JSON de registros que pydeck enviaría para df."""
+    if len(df) == 0:
+        return 0
+    parte = df.sample(min(muestra, len(df)), random_state=semilla)
+    return int(len(parte.to_json(orient='records')) / len(parte) * len(df))
+
+
+def _celdas_rejilla(df, latitud, longitud, celdas):
+    x = df[longitud].to_numpy(dtype=float)
+    y = df[latitud].to_numpy(dtype=float)
+    ix = np.minimum(((x - x.min()) / max(np.ptp(x), 1e-12) * celdas).astype(int), celdas - 1)
+    iy = np.minimum(((y - y.min()) / max(np.ptp(y), 1e-12) * celdas).astype(int), celdas - 1)
+    return iy * celdas + ix
+
+
+def muestra_estratificada(df, latitud, longitud, n, celdas=64, semilla=0):
+    """
+    Muestra de a lo más n filas repartida proporcionalmente entre las celdas de una
+    rejilla de celdas x celdas; toda celda con datos conserva al menos un punto. Si hay
+    más celdas con datos que n, la rejilla se hace más gruesa hasta que quepan.
+    """
+    if len(df) <= n:
+        return df
+    n = max(int(n), 1)
+    celda = _celdas_rejilla(df, latitud, longitud, celdas)
+    conteos = np.bincount(celda, minlength=celdas * celdas)
+    while celdas > 1 and np.count_nonzero(conteos) > n:
+        celdas //= 2
+        celda = _celdas_rejilla(df, latitud, longitud, celdas)
+        conteos = np.bincount(celda, minlength=celdas * celdas)
+    cuota = np.maximum(np.floor(conteos * n / len(df)), conteos > 0)
+
+    # Orden aleatorio dentro de cada celda y se toman las primeras «cuota» filas
+    orden = np.random.default_rng(semilla).permutation(len(df))
+    orden = orden[np.argsort(celda[orden], kind='stable')]
+    celda_ord = celda[orden]
+    inicio = np.concatenate(([0], np.cumsum(conteos)[:-1]))
+    posicion = np.arange(len(df)) - inicio[celda_ord]
+    filas = orden[posicion < cuota[celda_ord]]
+    return df.iloc[np.sort(filas)]
+
+
+def agregar_rejilla(df, latitud, longitud, celdas, nombre='nom_estab', grupo='nomgeo'):
+    """Un punto por celda de la rejilla, ubicado en el promedio de sus puntos, con su conteo."""
+    celda = _celdas_rejilla(df, latitud, longitud, celdas)
+    agregado = df.groupby(celda).agg(**{
+        latitud: (latitud, 'mean'),
+        longitud: (longitud, 'mean'),
+        grupo: (grupo, 'first'),
+        'puntos': (latitud, 'size'),
+    }).reset_index(drop=True)
+    agregado[nombre] = agregado['puntos'].astype(str) + ' puntos agrupados'
+    return agregado
+
+
+def ajustar_a_presupuesto(df, latitud, longitud, presupuesto, fraccion_minima=0.05,
+                          permitir_muestra=True):
+    """
+    Regresa (df_render, modo) con modo en 'completo', 'muestra' o 'agregado'.
+    Si cabe en el presupuesto se envía completo; si la muestra conservaría al menos
+    fraccion_minima de los puntos (y, medida de nuevo, cabe en el presupuesto) se usa la
+    muestra estratificada, y si no, la rejilla agregada (que conserva el conteo de todos
+    los puntos), cada vez más gruesa hasta que quepa. Con permitir_muestra=False
+    (capas que cuentan puntos, como HexagonLayer) se usa siempre la rejilla agregada.
+    """
+    total = estimar_bytes(df)
+    if total <= presupuesto:
+        return df, 'completo'
+
+    n = int(presupuesto / (total / len(df)))
+    if permitir_muestra and n >= fraccion_minima * len(df):
+        muestra = muestra_estratificada(df, latitud, longitud, n)
+        # Las filas de la muestra pueden pesar más que el promedio; se vuelve a medir
+        if estimar_bytes(muestra) <= presupuesto:
+            return muestra, 'muestra'
+
+    celdas = max(int(np.sqrt(n)), 1)
+    agregado = agregar_rejilla(df, latitud, longitud, celdas)
+    while celdas > 1 and estimar_bytes(agregado) > presupuesto:
+        celdas //= 2
+        agregado = agregar_rejilla(df, latitud, longitud, celdas)
+    return agregado, 'agregado'
+
+
+##
+# Validación de los datos
+# Cada renglón recibe un entero con banderas (bits) que se combinan con |; un renglón
+# limpio tiene 0. Las capas y los agregados filtran con estas banderas en lugar de
+# repetir las pruebas.
+##
+FUERA_LIMITES = 1       # Coordenadas fuera de la envolvente de las alcaldías
+DUPLICADO = 2           # Mismo nombre y mismas coordenadas que un renglón anterior
+CASI_DUPLICADO = 4      # Mismo nombre a no más de tolerancia grados (por eje) de un renglón anterior
+PRECIO_ATIPICO = 8      # Precio fuera de [Q1 - 1.5 IQR, Q3 + 1.5 IQR] de su alcaldía
+
+# Banderas que sacan un punto de los mapas
+EXCLUIR_MAPA = FUERA_LIMITES | DUPLICADO
+# Banderas que, sin sacarlo de los mapas, excluyen un punto de los conteos y agregados
+EXCLUIR_AGREGADOS = CASI_DUPLICADO
+# Banderas que excluyen un punto de las medidas de precio
+EXCLUIR_PRECIO = EXCLUIR_AGREGADOS | PRECIO_ATIPICO
+
+
+def _hash_renglones(**columnas):
+    return pd.util.hash_pandas_object(pd.DataFrame(columnas), index=False).to_numpy()
+
+
+def _casi_duplicados(x, y, nombres, tolerancia, candidatos):
+    """
+    Máscara de los candidatos con un candidato anterior del mismo nombre a no más de
+    tolerancia grados en cada eje. Cada celda de la rejilla de tolerancia se compara con
+    sus ocho vecinas, así que no se escapan los pares a ambos lados de un borde.
+    """
+    filas = np.flatnonzero(candidatos)
+    celdas = pd.DataFrame({
+        'cx': np.floor(x[filas] / tolerancia).astype(np.int64),
+        'cy': np.floor(y[filas] / tolerancia).astype(np.int64),
+        'n': pd.util.hash_array(nombres[filas]),
+        'fila': filas,
+    })
+    casi = np.zeros(len(x), dtype=bool)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            vecinas = celdas.assign(cx=celdas['cx'] + dx, cy=celdas['cy'] + dy)
+            pares = celdas.merge(vecinas, on=['cx', 'cy', 'n'], suffixes=('', '_previa'))
+            i = pares['fila'].to_numpy()
+            j = pares['fila_previa'].to_numpy()
+            cerca = ((j < i) & (np.abs(x[i] - x[j]) <= tolerancia)
+                     & (np.abs(y[i] - y[j]) <= tolerancia) & (nombres[i] == nombres[j]))
+            casi[i[cerca]] = True
+    return casi
+
+
+def conteo_agregados(df, grupo='nomgeo'):
+    """Renglones por grupo sin los marcados con EXCLUIR_AGREGADOS en la columna banderas."""
+    return df.loc[(df['banderas'] & EXCLUIR_AGREGADOS) == 0, grupo].value_counts()
+
+
+def banderas_validacion(df, latitud, longitud, envolvente, nombre='nom_estab', grupo='nomgeo',
+                        precio=None, tolerancia=1e-4):
+    """
+    Arreglo uint8 de banderas por renglón de df. envolvente es (minx, miny, maxx, maxy),
+    por ejemplo shape.total_bounds. Los casi duplicados son renglones del mismo nombre a no
+    más de tolerancia grados (1e-4 ~ 11 m) en cada eje de uno anterior.
+    """
+    x = df[longitud].to_numpy(dtype=float)
+    y = df[latitud].to_numpy(dtype=float)
+    banderas = np.zeros(len(df), dtype=np.uint8)
+
+    minx, miny, maxx, maxy = envolvente
+    dentro = (x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy)
+    banderas[~dentro] |= FUERA_LIMITES
+
+    nombres = df[nombre].astype(str).str.strip().str.upper().to_numpy()
+    exacto = pd.Series(_hash_renglones(x=x, y=y, n=nombres)).duplicated().to_numpy()
+    banderas[exacto] |= DUPLICADO
+    # Basta comparar contra los renglones que no son duplicados exactos: cada duplicado
+    # exacto tiene antes un original en las mismas coordenadas
+    candidatos = ~exacto & np.isfinite(x) & np.isfinite(y)
+    banderas[_casi_duplicados(x, y, nombres, tolerancia, candidatos)] |= CASI_DUPLICADO
+
+    if precio is not None:
+        p = pd.to_numeric(df[precio], errors='coerce').astype(float).reset_index(drop=True)
+        g = df[grupo].reset_index(drop=True)
+        q1 = p.groupby(g).transform('quantile', 0.25)
+        q3 = p.groupby(g).transform('quantile', 0.75)
+        iqr = q3 - q1
+        atipico = ((p < q1 - 1.5 * iqr) | (p > q3 + 1.5 * iqr)).to_numpy()
+        banderas[atipico] |= PRECIO_ATIPICO
+
+    return banderas
+
+
+def resumen_banderas(banderas):
+    """Número de renglones con cada bandera."""
+    nombres = {FUERA_LIMITES: 'Fuera de límites', DUPLICADO: 'Duplicado',
+               CASI_DUPLICADO: 'Casi duplicado', PRECIO_ATIPICO: 'Precio atípico'}
+    return pd.Series({texto: int(np.count_nonzero(banderas & bit))
+                      for bit, texto in nombres.items()}, name='renglones')
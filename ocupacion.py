@@ -0,0 +1,172 @@
+##
+# Ocupación e ingreso estimado a partir de los archivos completos de insideairbnb
+# (calendar.csv.gz y reviews.csv.gz). Los archivos se leen por bloques, de modo que la
+# memoria depende del número de listings y no del número de renglones.
+#
+# Uso:
+#   python ocupacion.py data/calendar.csv.gz data/reviews.csv.gz \
+#       --listings http://data.insideairbnb.com/mexico/df/mexico-city/2021-12-25/visualisations/listings.csv
+#
+# Se escriben dos archivos Arrow IPC (feather) pequeños en data/ocupacion/ que la página
+# lee sin volver a tocar los archivos originales.
+##
+import argparse
+import os
+
+import pandas as pd
+
+DIR_OCUPACION = 'data/ocupacion'
+TAM_BLOQUE = 1_000_000
+
+
+def _precio(serie):
+    # Los precios vienen como texto: "$1,234.00"
+    return pd.to_numeric(serie.str.replace(r'[$,]', '', regex=True), errors='coerce')
+
+
+def _acumular(acumulado, parcial):
+    if acumulado is None:
+        return parcial
+    return acumulado.add(parcial, fill_value=0)
+
+
+def _bloques(ruta, tam_bloque, **kwargs):
+    """Bloques con renglones de ruta; un archivo vacío o sólo con encabezado no da ninguno."""
+    try:
+        bloques = pd.read_csv(ruta, chunksize=tam_bloque, **kwargs)
+    except pd.errors.EmptyDataError:
+        return
+    with bloques:
+        for bloque in bloques:
+            if len(bloque):
+                yield bloque
+
+
+def resumen_calendario(ruta, tam_bloque=TAM_BLOQUE):
+    """
+    Noches en el calendario, noches no disponibles e ingreso estimado por listing.
+    Se considera ocupada toda noche con available == 'f'; incluye noches bloqueadas
+    por el anfitrión, así que la ocupación y el ingreso son cotas superiores.
+    Regresa también la primera fecha del calendario (fecha del snapshot), o NaT si el
+    archivo no tiene renglones.
+    """
+    acumulado = None
+    fecha_inicio = None
+    bloques = _bloques(ruta, tam_bloque, usecols=['listing_id', 'date', 'available', 'price'],
+                       dtype={'listing_id': 'int64', 'available': 'category', 'price': 'string'})
+    for bloque in bloques:
+        ocupada = bloque['available'] == 'f'
+        parcial = pd.DataFrame({
+            'listing_id': bloque['listing_id'],
+            'noches': 1,
+            'noches_ocupadas': ocupada.astype('int32'),
+            'ingreso_estimado': _precio(bloque['price']).where(ocupada, 0.0),
+        }).groupby('listing_id').sum()
+        acumulado = _acumular(acumulado, parcial)
+
+        inicio = bloque['date'].min()
+        fecha_inicio = inicio if fecha_inicio is None else min(fecha_inicio, inicio)
+
+    if acumulado is None:
+        # Archivo vacío o sólo con encabezado
+        vacio = pd.Index([], dtype='int64', name='listing_id')
+        return pd.DataFrame({'noches': pd.Series(dtype='int64', index=vacio),
+                             'noches_ocupadas': pd.Series(dtype='int32', index=vacio),
+                             'ingreso_estimado': pd.Series(dtype='float64', index=vacio)}), pd.NaT
+    return acumulado, pd.Timestamp(fecha_inicio)
+
+
+def resumen_resenas(ruta, desde, tam_bloque=TAM_BLOQUE):
+    """Reseñas totales, reseñas desde la fecha dada y fecha de la última reseña por listing."""
+    acumulado = None
+    ultima = None
+    # Sólo se leen dos columnas; la de comentarios es la más pesada del archivo
+    bloques = _bloques(ruta, tam_bloque, usecols=['listing_id', 'date'],
+                       dtype={'listing_id': 'int64'}, parse_dates=['date'])
+    for bloque in bloques:
+        parcial = pd.DataFrame({
+            'listing_id': bloque['listing_id'],
+            'resenas': 1,
+            'resenas_12m': (bloque['date'] >= desde).astype('int32'),
+        }).groupby('listing_id').sum()
+        acumulado = _acumular(acumulado, parcial)
+
+        maximo = bloque.groupby('listing_id')['date'].max()
+        ultima = maximo if ultima is None else pd.concat([ultima, maximo]).groupby(level=0).max()
+
+    if acumulado is None:
+        # Archivo vacío o sólo con encabezado
+        vacio = pd.Index([], dtype='int64', name='listing_id')
+        return pd.DataFrame({'resenas': pd.Series(dtype='int64', index=vacio),
+                             'resenas_12m': pd.Series(dtype='int32', index=vacio),
+                             'ultima_resena': pd.Series(dtype='datetime64[ns]', index=vacio)})
+    acumulado['ultima_resena'] = ultima
+    return acumulado
+
+
+def por_listing(ruta_calendario, ruta_resenas, tam_bloque=TAM_BLOQUE):
+    calendario, fecha_inicio = resumen_calendario(ruta_calendario, tam_bloque)
+    resenas = resumen_resenas(ruta_resenas, fecha_inicio - pd.Timedelta(days=365), tam_bloque)
+
+    resumen = calendario.join(resenas, how='left')
+    resumen[['resenas', 'resenas_12m']] = resumen[['resenas', 'resenas_12m']].fillna(0)
+    resumen['tasa_ocupacion'] = resumen['noches_ocupadas'] / resumen['noches']
+    return resumen.reset_index().rename(columns={'listing_id': 'id'}).astype({
+        'noches': 'int16', 'noches_ocupadas': 'int16',
+        'resenas': 'int32', 'resenas_12m': 'int32',
+        'ingreso_estimado': 'float32', 'tasa_ocupacion': 'float32',
+    })
+
+
+def por_alcaldia(resumen, listings):
+    """Agrega el resumen por listing a nivel alcaldía usando id -> nomgeo de los listings."""
+    datos = resumen.merge(listings[['id', 'nomgeo']], on='id', how='inner')
+    agregado = datos.groupby('nomgeo').agg(
+        listings=('id', 'size'),
+        noches=('noches', 'sum'),
+        noches_ocupadas=('noches_ocupadas', 'sum'),
+        ingreso_estimado=('ingreso_estimado', 'sum'),
+        ingreso_mediano=('ingreso_estimado', 'median'),
+        resenas_12m=('resenas_12m', 'sum'),
+    )
+    agregado['tasa_ocupacion'] = agregado['noches_ocupadas'] / agregado['noches']
+    return agregado.reset_index()
+
+
+def rutas_ocupacion(directorio=DIR_OCUPACION):
+    return (os.path.join(directorio, 'por_listing.feather'),
+            os.path.join(directorio, 'por_alcaldia.feather'))
+
+
+def leer_ocupacion(directorio=DIR_OCUPACION):
+    """(por_listing, por_alcaldia) ya calculados, o None si no se ha corrido el proceso."""
+    rutas = rutas_ocupacion(directorio)
+    if not all(os.path.isfile(ruta) for ruta in rutas):
+        return None
+    return tuple(pd.read_feather(ruta) for ruta in rutas)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Ocupación e ingreso estimado por listing y por alcaldía.')
+    parser.add_argument('calendario', help='calendar.csv.gz de insideairbnb')
+    parser.add_argument('resenas', help='reviews.csv.gz de insideairbnb')
+    parser.add_argument('--listings', required=True,
+                        help='listings.csv (ruta o URL) con las columnas id y neighbourhood')
+    parser.add_argument('--destino', default=DIR_OCUPACION)
+    parser.add_argument('--bloque', type=int, default=TAM_BLOQUE)
+    args = parser.parse_args()
+
+    resumen = por_listing(args.calendario, args.resenas, args.bloque)
+    listings = pd.read_csv(args.listings, usecols=['id', 'neighbourhood'])
+    alcaldias = por_alcaldia(resumen, listings.rename(columns={'neighbourhood': 'nomgeo'}))
+
+    os.makedirs(args.destino, exist_ok=True)
+    ruta_listing, ruta_alcaldia = rutas_ocupacion(args.destino)
+    resumen.to_feather(ruta_listing)
+    alcaldias.to_feather(ruta_alcaldia)
+    print(f'{len(resumen):,} listings, {len(alcaldias)} alcaldías -> {args.destino}')
+
+
+if __name__ == '__main__':
+    main()
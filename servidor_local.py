@@ -0,0 +1,118 @@
+##
+# Servidor HTTP local que sustituye a data.insideairbnb.com
+# Sirve un directorio con soporte de peticiones Range e If-Range (para reanudar
+# descargas; cada archivo lleva ETag y Last-Modified) y puede cortar las respuestas
+# después de cierto número de bytes para simular fallas de red.
+# Permite probar y medir descarga.py sin conexión:
+#
+#   with ServidorLocal('data/insideairbnb') as servidor:
+#       descargar_snapshot(servidor.url, ARCHIVOS_SNAPSHOT, 'tmp/espejo')
+#
+# o desde la línea de comandos: python servidor_local.py data/insideairbnb --puerto 8000
+##
+import argparse
+import functools
+import os
+import re
+import shutil
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ManejadorRange(SimpleHTTPRequestHandler):
+    # Bytes a enviar antes de cortar la conexión; None para respuestas completas
+    corte = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        ruta = self.translate_path(self.path)
+        if not os.path.isfile(ruta):
+            return super().do_GET()
+
+        estado = os.stat(ruta)
+        total = estado.st_size
+        etag = f'"{estado.st_size:x}-{estado.st_mtime_ns:x}"'
+        modificado = self.date_time_string(int(estado.st_mtime))
+        inicio, fin = 0, total - 1
+        rango = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if rango and self.headers.get('If-Range', etag) not in (etag, modificado):
+            rango = None        # El archivo cambió desde la descarga parcial: va completo
+        if rango:
+            inicio = int(rango.group(1))
+            if rango.group(2):
+                fin = min(int(rango.group(2)), total - 1)
+            if inicio >= total:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{total}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        self.send_response(206 if rango else 200)
+        self.send_header('Content-Type', self.guess_type(ruta))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', modificado)
+        self.send_header('Content-Length', str(fin - inicio + 1))
+        if rango:
+            self.send_header('Content-Range', f'bytes {inicio}-{fin}/{total}')
+        self.end_headers()
+
+        por_enviar = fin - inicio + 1
+        if self.corte is not None:
+            por_enviar = min(por_enviar, self.corte)
+        with open(ruta, 'rb') as archivo:
+            archivo.seek(inicio)
+            shutil.copyfileobj(_Limitado(archivo, por_enviar), self.wfile)
+        if por_enviar < fin - inicio + 1:
+            self.close_connection = True
+
+
+class _Limitado:
+    def __init__(self, archivo, restante):
+        self.archivo, self.restante = archivo, restante
+
+    def read(self, n=-1):
+        if n < 0 or n > self.restante:
+            n = self.restante
+        datos = self.archivo.read(n)
+        self.restante -= len(datos)
+        return datos
+
+
+class ServidorLocal:
+    """Servidor en un hilo de fondo; url apunta a la raíz del directorio servido."""
+
+    def __init__(self, directorio, puerto=0, corte=None):
+        manejador = type('Manejador', (ManejadorRange,), {'corte': corte})
+        self.servidor = ThreadingHTTPServer(
+            ('127.0.0.1', puerto), functools.partial(manejador, directory=directorio))
+        self.url = f'http://127.0.0.1:{self.servidor.server_address[1]}/'
+        self.hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local de un snapshot de insideairbnb.')
+    parser.add_argument('directorio')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--corte', type=int, default=None,
+                        help='bytes enviados por respuesta antes de cortar la conexión')
+    args = parser.parse_args()
+
+    with ServidorLocal(args.directorio, args.puerto, args.corte) as servidor:
+        print(f'Sirviendo {args.directorio} en {servidor.url}')
+        servidor.hilo.join()
+
+
+if __name__ == '__main__':
+    main()